@@ -1,41 +1,136 @@
-import json
+import functools
 import os
-import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Set, Union
+import time
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import boto3
+import msgspec
+import orjson
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.event_handler import APIGatewayRestResolver
-from aws_lambda_powertools.event_handler.api_gateway import CORSConfig
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from boto3.dynamodb.conditions import Key
-from pydantic import BaseModel, Field
-
-cors_config = CORSConfig(
-    allow_origin="*",
-    allow_headers=["Content-Type", "Authorization"],
-    expose_headers=["Content-Type"],
-    max_age=300,
-)
+
+_encoder: msgspec.json.Encoder = msgspec.json.Encoder(enc_hook=str)
+# Reused across warm invocations instead of allocating per response; a
+# Lambda environment serves one at a time. encode_into resizes it as needed
+_encode_buffer: bytearray = bytearray()
+
+
+def _dumps(obj: Any) -> str:
+    return orjson.dumps(obj, default=str).decode()
+
+
+def _dumps_sqs(obj: Any) -> str:
+    # orjson writes raw UTF-8, but SQS rejects the U+FFFE/U+FFFF
+    # noncharacters, so they are sent as JSON escapes
+    return (
+        _dumps(obj).replace("\ufffe", "\\ufffe").replace("\uffff", "\\uffff")
+    )
+
+
+def _encode(obj: Any) -> str:
+    _encoder.encode_into(obj, _encode_buffer)
+    return _encode_buffer.decode()
+
+
+CROCKFORD_BASE32: str = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def _utc_timestamp(timestamp_ns: int) -> str:
+    seconds, nanoseconds = divmod(timestamp_ns, 1_000_000_000)
+    return (
+        time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+        + f".{nanoseconds // 1000:06d}Z"
+    )
+
+
+def _count_tokens(content: str) -> int:
+    stripped: str = content.strip()
+    if not stripped:
+        return 0
+    # Printable text has no whitespace besides " ", so single-spaced input
+    # can be counted without materializing the split list
+    if stripped.isprintable() and "  " not in stripped:
+        return stripped.count(" ") + 1
+    return len(stripped.split())
+
+
+def _ulid(timestamp_ns: int) -> str:
+    value: int = ((timestamp_ns // 1_000_000) << 80) | int.from_bytes(
+        os.urandom(10), "big"
+    )
+    return "".join(
+        CROCKFORD_BASE32[(value >> shift) & 0x1F]
+        for shift in range(125, -1, -5)
+    )
+
+
+def _session_pk(user_id: str, session_id: str) -> str:
+    return f"USER#{user_id}#SESSION#{session_id}"
+
+
+def _from_attribute_value(attribute: Dict[str, Any]) -> Any:
+    ((kind, value),) = attribute.items()
+    if kind == "S":
+        return value
+    if kind == "N":
+        return int(value) if value.lstrip("-").isdigit() else float(value)
+    if kind == "M":
+        return {k: _from_attribute_value(v) for k, v in value.items()}
+    if kind == "L":
+        return [_from_attribute_value(v) for v in value]
+    if kind == "BOOL":
+        return value
+    if kind == "NULL":
+        return None
+    raise TypeError(f"Unsupported DynamoDB attribute type: {kind}")
+
 
 logger: Logger = Logger()
-app: APIGatewayRestResolver = APIGatewayRestResolver(cors=cors_config)
 
 DYNAMODB_TABLE: str = os.environ["DYNAMODB_TABLE"]
 SQS_QUEUE_URL: str = os.environ["SQS_QUEUE_URL"]
 
-dynamodb_resource = boto3.resource("dynamodb")
-sqs_client = boto3.client("sqs")
+
+@functools.cache
+def _get_boto_config() -> Any:
+    from botocore.config import Config
+
+    return Config(
+        tcp_keepalive=True,
+        max_pool_connections=50,
+        retries={"max_attempts": 2, "mode": "standard"},
+    )
 
 
-class MessageMetadata(BaseModel):
-    tokens: int = Field(default=0)
-    source: str = Field(default="api")
+@functools.cache
+def _get_dynamodb_client() -> Any:
+    import boto3
 
+    return boto3.client("dynamodb", config=_get_boto_config())
 
-class MessageInDB(BaseModel):
+
+@functools.cache
+def _get_sqs_client() -> Any:
+    import boto3
+
+    return boto3.client("sqs", config=_get_boto_config())
+
+
+class MessageMetadata(msgspec.Struct):
+    tokens: int = 0
+    source: str = "api"
+
+
+class MessageInDB(msgspec.Struct, kw_only=True):
     PK: str
     SK: str
     message_id: str
@@ -47,89 +142,133 @@ class MessageInDB(BaseModel):
     metadata: MessageMetadata
 
 
-class SendMessageRequest(BaseModel):
-    user_id: str
-    session_id: str
+# Identifiers are interpolated verbatim into SQS_MESSAGE_TEMPLATE, so they
+# must not contain characters that need escaping in JSON
+Identifier = Annotated[str, msgspec.Meta(pattern=r'^[^"\\\x00-\x1f]+\Z')]
+
+
+class SendMessageRequest(msgspec.Struct):
+    user_id: Identifier
+    session_id: Identifier
     content: str
 
 
-class GetMessagesQueryParams(BaseModel):
+class GetMessagesQueryParams(msgspec.Struct):
     user_id: str
     session_id: str
-    limit: int = Field(default=50, ge=1, le=100)
+    limit: Annotated[int, msgspec.Meta(ge=1, le=100)] = 50
 
 
-class MessageSentResponse(BaseModel):
+class MessageSentResponse(msgspec.Struct, kw_only=True):
     message_id: str
     status: str = "processing"
     timestamp: str
 
 
-class ConversationResponse(BaseModel):
+class ConversationResponse(msgspec.Struct):
     messages: List[MessageInDB]
     count: int
 
 
-class UserSessionResponse(BaseModel):
+class UserSessionResponse(msgspec.Struct):
     user_id: str
     sessions: List[str]
 
 
+SQS_MESSAGE_TEMPLATE: str = (
+    '{{"user_id":"{user_id}","session_id":"{session_id}",'
+    '"message_id":"{message_id}","message":{{'
+    '"PK":"{pk}","SK":"{timestamp}","message_id":"{message_id}",'
+    '"role":"user","content":{content},"created_at":"{timestamp}",'
+    '"session_status":"active","gsi1pk":"USER#{user_id}",'
+    '"gsi1sk":"{session_id}",'
+    '"metadata":{{"tokens":{tokens},"source":"api"}}}}}}'
+)
+
+MESSAGE_PROJECTION_NAMES: Dict[str, str] = {
+    f"#{name}": name for name in MessageInDB.__struct_fields__
+}
+MESSAGE_PROJECTION_EXPRESSION: str = ", ".join(MESSAGE_PROJECTION_NAMES)
+
+_send_message_decoder: msgspec.json.Decoder[SendMessageRequest] = (
+    msgspec.json.Decoder(SendMessageRequest)
+)
+
+
 class DynamoDBRepository:
-    def __init__(self, table_name: str, dynamodb_resource: Any):
-        self.table: Any = dynamodb_resource.Table(table_name)
+    def __init__(self, table_name: str, client_factory: Callable[[], Any]):
+        self.table_name: str = table_name
+        self.client_factory: Callable[[], Any] = client_factory
         logger.info(f"DynamoDBRepository initialized for table: {table_name}")
 
-    def put_item(self, item: Dict[str, Any]) -> None:
-        self.table.put_item(Item=item)
+    @property
+    def client(self) -> Any:
+        return self.client_factory()
 
     def query_messages(
         self, user_id: str, session_id: str, limit: int = 50
     ) -> List[MessageInDB]:
-        pk: str = f"USER#{user_id}#SESSION#{session_id}"
-
-        response: Dict[str, Any] = self.table.query(
-            KeyConditionExpression=Key("PK").eq(pk),
+        pk: str = _session_pk(user_id, session_id)
+
+        response: Dict[str, Any] = self.client.query(
+            TableName=self.table_name,
+            KeyConditionExpression="PK = :pk",
+            ProjectionExpression=MESSAGE_PROJECTION_EXPRESSION,
+            ExpressionAttributeNames=MESSAGE_PROJECTION_NAMES,
+            ExpressionAttributeValues={":pk": {"S": pk}},
             ScanIndexForward=True,
             Limit=limit,
+            ReturnConsumedCapacity="NONE",
         )
 
         messages_raw: List[Dict[str, Any]] = response.get("Items", [])
         messages: List[MessageInDB] = [
-            MessageInDB.model_validate(item) for item in messages_raw
+            msgspec.convert(_from_attribute_value({"M": item}), MessageInDB)
+            for item in messages_raw
         ]
         return messages
 
     def get_user_sessions(self, user_id: str) -> List[str]:
-        response: Dict[str, Any] = self.table.query(
-            IndexName="SessionStatusIndex",
-            KeyConditionExpression=Key("session_status").eq("active"),
-            FilterExpression="begins_with(PK, :user_prefix)",
-            ExpressionAttributeValues={":user_prefix": f"USER#{user_id}#"},
-        )
-
-        sessions: Set[str] = set()
-        for item in response.get("Items", []):
-            pk: str = item["PK"]
-            try:
-                session_id: str = pk.split("#SESSION#")[1]
-                sessions.add(session_id)
-            except IndexError:
-                logger.warning(
-                    f"PK format incorrect for session extraction: {pk}"
+        # The index holds one key per user message, so a user's sessions can
+        # span several 1 MB pages
+        query_kwargs: Dict[str, Any] = {
+            "TableName": self.table_name,
+            "IndexName": "UserSessionsIndex",
+            "KeyConditionExpression": "gsi1pk = :pk",
+            "ProjectionExpression": "gsi1sk",
+            "ExpressionAttributeValues": {":pk": {"S": f"USER#{user_id}"}},
+        }
+        sessions: Dict[str, None] = {}
+        while True:
+            response: Dict[str, Any] = self.client.query(**query_kwargs)
+            sessions.update(
+                dict.fromkeys(
+                    item["gsi1sk"]["S"] for item in response.get("Items", [])
                 )
+            )
+
+            last_key: Optional[Dict[str, Any]] = response.get(
+                "LastEvaluatedKey"
+            )
+            if last_key is None:
+                break
+            query_kwargs["ExclusiveStartKey"] = last_key
 
         return list(sessions)
 
 
 class SQSRepository:
-    def __init__(self, queue_url: str, sqs_client: Any):
+    def __init__(self, queue_url: str, client_factory: Callable[[], Any]):
         self.queue_url: str = queue_url
-        self.sqs_client: Any = sqs_client
+        self.client_factory: Callable[[], Any] = client_factory
+
+    @property
+    def client(self) -> Any:
+        return self.client_factory()
 
-    def send_message(self, message_body: Dict[str, Any]) -> None:
-        self.sqs_client.send_message(
-            QueueUrl=self.queue_url, MessageBody=json.dumps(message_body)
+    def send_message(self, message_body: str) -> None:
+        self.client.send_message(
+            QueueUrl=self.queue_url, MessageBody=message_body
         )
 
 
@@ -147,38 +286,21 @@ class ChatService:
         session_id: str = body.session_id
         content: str = body.content
 
-        message_id: str = str(uuid.uuid4())
-        timestamp: str = (
-            datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        timestamp_ns: int = time.time_ns()
+        message_id: str = _ulid(timestamp_ns)
+        timestamp: str = _utc_timestamp(timestamp_ns)
+
+        sqs_message: str = SQS_MESSAGE_TEMPLATE.format(
+            user_id=user_id,
+            session_id=session_id,
+            message_id=message_id,
+            pk=_session_pk(user_id, session_id),
+            timestamp=timestamp,
+            content=_dumps_sqs(content),
+            tokens=_count_tokens(content),
         )
-
-        pk: str = f"USER#{user_id}#SESSION#{session_id}"
-        sk: str = timestamp
-
-        token_count: int = len(content.split())
-
-        item_data = {
-            "PK": pk,
-            "SK": sk,
-            "message_id": message_id,
-            "role": "user",
-            "content": content,
-            "created_at": timestamp,
-            "session_status": "active",
-            "metadata": MessageMetadata(tokens=token_count).model_dump(),
-        }
-
-        MessageInDB.model_validate(item_data)
-        self.dynamodb_repository.put_item(item_data)
-        logger.info(f"Saved user message: {message_id}")
-
-        sqs_message: Dict[str, str] = {
-            "user_id": user_id,
-            "session_id": session_id,
-            "message_id": message_id,
-        }
         self.sqs_repository.send_message(sqs_message)
-        logger.info(f"Sent message to SQS: {message_id}")
+        logger.info(f"Queued message for SQS: {message_id}")
 
         return MessageSentResponse(message_id=message_id, timestamp=timestamp)
 
@@ -199,23 +321,39 @@ class ChatService:
 
 
 dynamodb_repository: DynamoDBRepository = DynamoDBRepository(
-    DYNAMODB_TABLE, dynamodb_resource
+    DYNAMODB_TABLE, _get_dynamodb_client
 )
-sqs_repository: SQSRepository = SQSRepository(SQS_QUEUE_URL, sqs_client)
+sqs_repository: SQSRepository = SQSRepository(SQS_QUEUE_URL, _get_sqs_client)
 chat_service: ChatService = ChatService(dynamodb_repository, sqs_repository)
 
+HEALTH_RESPONSE: Dict[str, Any] = {
+    "statusCode": 200,
+    "body": _dumps({"status": "healthy", "service": "chat-api"}),
+}
+
+NOT_FOUND_RESPONSE: Dict[str, Any] = {
+    "statusCode": 404,
+    "message": "Not found",
+}
 
-@app.post("/chat")
-def post_chat_message() -> Dict[str, Any]:
+# Preflight requests are answered by the API Gateway mock integrations in
+# api-spec.yaml, so actual responses only need the allowed origin
+RESPONSE_HEADERS: Dict[str, str] = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+}
+
+
+def post_chat_message(event: Dict[str, Any]) -> Dict[str, Any]:
     try:
-        body: SendMessageRequest = SendMessageRequest.model_validate(
-            app.current_event.json_body
+        body: SendMessageRequest = _send_message_decoder.decode(
+            event.get("body") or ""
         )
         response_model: MessageSentResponse = chat_service.send_message(body)
 
         return {
             "statusCode": 202,
-            "body": response_model.model_dump(),
+            "body": response_model,
         }
     except Exception as e:
         logger.exception("Error processing message in route")
@@ -224,24 +362,20 @@ def post_chat_message() -> Dict[str, Any]:
         )
         return {
             "statusCode": 500,
-            "body": json.dumps({"error": error_message}),
+            "body": _dumps({"error": error_message}),
         }
 
 
-@app.get("/messages")
-def get_conversation_messages() -> Dict[str, Any]:
+def get_conversation_messages(event: Dict[str, Any]) -> Dict[str, Any]:
     try:
+        query_string: Dict[str, str] = event.get("queryStringParameters") or {}
         query_params_raw: Dict[str, Any] = {
-            "user_id": app.current_event.get_query_string_value("user_id"),
-            "session_id": app.current_event.get_query_string_value(
-                "session_id"
-            ),
-            "limit": app.current_event.get_query_string_value(
-                "limit", default_value="50"
-            ),
+            "user_id": query_string.get("user_id"),
+            "session_id": query_string.get("session_id"),
+            "limit": query_string.get("limit", "50"),
         }
-        query_params: GetMessagesQueryParams = (
-            GetMessagesQueryParams.model_validate(query_params_raw)
+        query_params: GetMessagesQueryParams = msgspec.convert(
+            query_params_raw, GetMessagesQueryParams, strict=False
         )
 
         response_model: ConversationResponse = chat_service.get_messages(
@@ -250,7 +384,7 @@ def get_conversation_messages() -> Dict[str, Any]:
 
         return {
             "statusCode": 200,
-            "body": response_model.model_dump(by_alias=True),
+            "body": response_model,
         }
     except Exception as e:
         logger.exception("Error fetching messages in route")
@@ -259,38 +393,65 @@ def get_conversation_messages() -> Dict[str, Any]:
         )
         return {
             "statusCode": 500,
-            "body": json.dumps({"error": error_message}),
+            "body": _dumps({"error": error_message}),
         }
 
 
-@app.get("/sessions/<user_id>")
-def get_sessions(user_id: str) -> Dict[str, Any]:
+def get_sessions(event: Dict[str, Any]) -> Dict[str, Any]:
     try:
+        user_id: str = event["pathParameters"]["user_id"]
         response_model: UserSessionResponse = chat_service.get_user_sessions(
             user_id
         )
 
         return {
             "statusCode": 200,
-            "body": response_model.model_dump(),
+            "body": response_model,
         }
     except Exception as e:
         logger.exception("Error fetching sessions in route")
-        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+        return {"statusCode": 500, "body": _dumps({"error": str(e)})}
+
+
+ROUTES: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    ("POST", "/chat"): post_chat_message,
+    ("GET", "/messages"): get_conversation_messages,
+    ("GET", "/sessions/{user_id}"): get_sessions,
+}
 
+HEALTH_ROUTE: Tuple[str, str] = ("GET", "/health")
 
-@app.get("/health")
-def health() -> Dict[str, Any]:
+
+def _proxy_response(status_code: int, body: Any) -> Dict[str, Any]:
     return {
-        "statusCode": 200,
-        "body": json.dumps({"status": "healthy", "service": "chat-api"}),
+        "statusCode": status_code,
+        "headers": RESPONSE_HEADERS,
+        "body": _encode(body),
+        "isBase64Encoded": False,
     }
 
 
+# The health check never changes, so its full proxy response is built once
+HEALTH_PROXY_RESPONSE: Dict[str, Any] = _proxy_response(200, HEALTH_RESPONSE)
+
+
 @logger.inject_lambda_context(
     correlation_id_path=correlation_paths.API_GATEWAY_REST
 )
 def lambda_handler(
     event: Dict[str, Any], context: LambdaContext
 ) -> Dict[str, Any]:
-    return app.resolve(event, context)
+    route_key: Tuple[str, str] = (
+        event.get("httpMethod", ""),
+        event.get("resource", ""),
+    )
+    if route_key == HEALTH_ROUTE:
+        return HEALTH_PROXY_RESPONSE
+
+    route: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = ROUTES.get(
+        route_key
+    )
+    if route is None:
+        return _proxy_response(404, NOT_FOUND_RESPONSE)
+
+    return _proxy_response(200, route(event))
@@ -26,6 +26,9 @@ const App = () => {
   });
 
   const messagesEndRef = useRef(null);
+  // The API only queues a message; it is stored together with the reply,
+  // so the sent message is shown locally until the server returns it
+  const pendingMessageRef = useRef(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -46,7 +49,16 @@ const App = () => {
       }
 
       const data = await response.json();
-      const messages = data?.body?.messages ?? [];
+      const serverMessages = data?.body?.messages ?? [];
+      const pending = pendingMessageRef.current;
+      let messages = serverMessages;
+      if (pending) {
+        if (serverMessages.some((m) => m.message_id === pending.message_id)) {
+          pendingMessageRef.current = null;
+        } else {
+          messages = [...serverMessages, pending];
+        }
+      }
       setMessages(messages);
       setError(null);
       return messages;
@@ -118,6 +130,15 @@ const App = () => {
       const responseData = await response.json();
       const userMessageTimestamp = responseData.body.timestamp;
 
+      const pendingMessage = {
+        message_id: responseData.body.message_id,
+        role: "user",
+        content: messageContent,
+        created_at: userMessageTimestamp,
+      };
+      pendingMessageRef.current = pendingMessage;
+      setMessages((prev) => [...prev, pendingMessage]);
+
       await fetchMessages();
 
       await pollForAssistantResponse(userMessageTimestamp);
@@ -132,6 +153,7 @@ const App = () => {
     const newSessionId = generateId();
     setSessionId(newSessionId);
     localStorage.setItem("sessionId", newSessionId);
+    pendingMessageRef.current = null;
     setMessages([]);
     setError(null);
   };
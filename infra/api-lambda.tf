@@ -114,11 +114,9 @@ resource "aws_iam_role_policy" "api_lambda_policy" {
     Statement = [
       {
         Effect = "Allow"
+        # Messages are persisted by the worker, the API only reads them
         Action = [
-          "dynamodb:PutItem",
-          "dynamodb:GetItem",
-          "dynamodb:Query",
-          "dynamodb:UpdateItem"
+          "dynamodb:Query"
         ]
         Resource = [
           aws_dynamodb_table.conversations.arn,
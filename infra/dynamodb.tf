@@ -27,6 +27,24 @@ resource "aws_dynamodb_table" "conversations" {
     projection_type = "ALL"
   }
 
+  attribute {
+    name = "gsi1pk"
+    type = "S"
+  }
+
+  attribute {
+    name = "gsi1sk"
+    type = "S"
+  }
+
+  # Sparse GSI for listing a user's sessions, only user messages carry the keys
+  global_secondary_index {
+    name            = "UserSessionsIndex"
+    hash_key        = "gsi1pk"
+    range_key       = "gsi1sk"
+    projection_type = "KEYS_ONLY"
+  }
+
   ttl {
     attribute_name = "ttl"
     enabled        = true
@@ -37,3 +55,8 @@ resource "aws_dynamodb_table" "conversations" {
     Environment = var.environment
   }
 }
+
+output "dynamodb_table_name" {
+  description = "Name of the conversations DynamoDB table"
+  value       = aws_dynamodb_table.conversations.name
+}
@@ -26,8 +26,9 @@ resource "aws_sqs_queue" "chat_tasks" {
 }
 
 resource "aws_lambda_event_source_mapping" "worker_sqs_trigger" {
-  event_source_arn = aws_sqs_queue.chat_tasks.arn
-  function_name    = aws_lambda_function.worker_lambda.arn
-  batch_size       = 1
-  enabled          = true
+  event_source_arn        = aws_sqs_queue.chat_tasks.arn
+  function_name           = aws_lambda_function.worker_lambda.arn
+  batch_size              = 10 # Records are processed concurrently by the worker
+  function_response_types = ["ReportBatchItemFailures"]
+  enabled                 = true
 }
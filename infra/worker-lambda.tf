@@ -133,6 +133,7 @@ resource "aws_iam_role_policy" "worker_lambda_policy" {
         Effect = "Allow"
         Action = [
           "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:GetItem",
           "dynamodb:Query",
           "dynamodb:UpdateItem"
@@ -0,0 +1,57 @@
+# /// script
+# dependencies = ["boto3"]
+# ///
+"""Add the UserSessionsIndex keys to user messages stored before the index.
+
+Usage: uv run scripts/backfill_user_sessions.py <dynamodb-table-name>
+"""
+
+import sys
+from typing import Any, Dict
+
+import boto3
+
+SESSION_SEPARATOR: str = "#SESSION#"
+
+
+def backfill(table_name: str) -> int:
+    table: Any = boto3.resource("dynamodb").Table(table_name)
+    scan_kwargs: Dict[str, Any] = {
+        "FilterExpression": "#r = :user AND attribute_not_exists(gsi1pk)",
+        "ProjectionExpression": "PK, SK",
+        "ExpressionAttributeNames": {"#r": "role"},
+        "ExpressionAttributeValues": {":user": "user"},
+    }
+
+    updated: int = 0
+    while True:
+        response: Dict[str, Any] = table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            user_key, separator, session_id = item["PK"].partition(
+                SESSION_SEPARATOR
+            )
+            if not separator:
+                print(f"Skipping item with unexpected PK: {item['PK']}")
+                continue
+
+            table.update_item(
+                Key={"PK": item["PK"], "SK": item["SK"]},
+                UpdateExpression="SET gsi1pk = :pk, gsi1sk = :sk",
+                ExpressionAttributeValues={
+                    ":pk": user_key,
+                    ":sk": session_id,
+                },
+            )
+            updated += 1
+
+        last_key: Any = response.get("LastEvaluatedKey")
+        if last_key is None:
+            return updated
+        scan_kwargs["ExclusiveStartKey"] = last_key
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+
+    print(f"Updated {backfill(sys.argv[1])} messages")
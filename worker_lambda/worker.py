@@ -1,35 +1,93 @@
-import json
 import os
-import uuid
+import time
 from abc import ABC, abstractmethod
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Union
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Final,
+    List,
+    Mapping,
+    NotRequired,
+    Set,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
 import boto3
+import orjson
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
 from boto3.resources.base import ServiceResource
 from botocore.client import BaseClient
-from langchain_aws import ChatBedrockConverse
-from langchain_core.messages import AIMessage, HumanMessage
-from pydantic import BaseModel, Field
+from botocore.config import Config
+from pydantic import BaseModel, ConfigDict, Field
+
+if TYPE_CHECKING:
+    from langchain_aws import ChatBedrockConverse
+    from langchain_core.messages import AIMessage, HumanMessage
 
 logger: Logger = Logger()
 
 DYNAMODB_TABLE: str = os.environ["DYNAMODB_TABLE"]
 LLM_PROVIDER_STRATEGY: str = os.environ.get(
-    "LLM_PROVIDER_STRATEGY", "LangchainLLMAmazonNovaLiteStrategy"
+    "LLM_PROVIDER_STRATEGY", "BedrockConverseStrategy"
 )
-BEDROCK_MODEL_ID: str = os.environ.get(
+BEDROCK_MODEL_ID: Final[str] = os.environ.get(
     "BEDROCK_MODEL_ID", "amazon.nova-lite-v1:0"
 )
+MAX_CONCURRENT_RECORDS: int = int(
+    os.environ.get("MAX_CONCURRENT_RECORDS", "10")
+)
+MAX_SEEN_MESSAGES: int = 2048
+
+ASSISTANT_ROLE: Final[str] = "assistant"
+SESSION_STATUS_ACTIVE: Final[str] = "active"
+
+_DUMPS = orjson.dumps
+
+
+def _utc_timestamp(timestamp_ns: int) -> str:
+    seconds, nanoseconds = divmod(timestamp_ns, 1_000_000_000)
+    return (
+        time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+        + f".{nanoseconds // 1000:06d}Z"
+    )
+
+
+# Shared by both clients: records are processed concurrently, so the pool
+# must cover MAX_CONCURRENT_RECORDS, and adaptive retries absorb Bedrock
+# throttling
+boto_config: Config = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"max_attempts": 6, "mode": "adaptive"},
+)
+
+
+def _session_pk(user_id: str, session_id: str) -> str:
+    return f"USER#{user_id}#SESSION#{session_id}"
+
+
+dynamodb_resource: ServiceResource = boto3.resource(
+    "dynamodb", config=boto_config
+)
+bedrock_client: BaseClient = boto3.client(
+    "bedrock-runtime", config=boto_config
+)
 
-dynamodb_resource: ServiceResource = boto3.resource("dynamodb")
-bedrock_client: BaseClient = boto3.client("bedrock-runtime")
+
+class HistoryMessage(TypedDict):
+    role: str
+    content: Union[str, Dict[str, Union[str, int]]]
 
 
-class Message(BaseModel):
+class Message(TypedDict):
     PK: str
     SK: str
     message_id: str
@@ -37,89 +95,125 @@ class Message(BaseModel):
     content: Union[str, Dict[str, Union[str, int]]]
     created_at: str
     session_status: str
-    model: Union[str, None] = None
+    model: NotRequired[str]
+    gsi1pk: NotRequired[str]
+    gsi1sk: NotRequired[str]
     metadata: Dict[str, Any]
 
 
 class LLMUsage(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     input_tokens: int = Field(default=0)
     output_tokens: int = Field(default=0)
 
 
 class LLMResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     content: Union[str, List[Union[str, Dict[Any, Any]]]]
     usage: LLMUsage
 
 
 class WorkerMessageBody(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     user_id: str
     session_id: str
     message_id: str
+    message: Union[Message, None] = None
 
 
-class AssistantMetadata(BaseModel):
+class AssistantMetadata(TypedDict):
     latency_ms: int
     input_tokens: int
     output_tokens: int
     user_message_id: str
 
 
-class LLMInputMessage(BaseModel):
-    role: str
-    content: str
+# (role, content) pair handed to the LLM strategies
+LLMInputMessage = Tuple[str, str]
 
 
 class DynamoDBRepository:
     def __init__(self, table_name: str, dynamodb_resource: Any):
+        self.table_name: str = table_name
+        # Resources are not thread-safe, so the Table is only used from the
+        # handler thread; record threads share the underlying client
         self.table: Any = dynamodb_resource.Table(table_name)
-        logger.info(f"DynamoDBRepository initialized for table: {table_name}")
+        self.client: BaseClient = dynamodb_resource.meta.client
+        self.deserializer: TypeDeserializer = TypeDeserializer()
+        logger.info("DynamoDBRepository initialized for table: %s", table_name)
 
     def get_conversation_history(
-        self, user_id: str, session_id: str, limit: int = 10
-    ) -> List[Message]:
-        pk: str = f"USER#{user_id}#SESSION#{session_id}"
-        response: Dict[str, Any] = self.table.query(
-            KeyConditionExpression=Key("PK").eq(pk),
-            ScanIndexForward=False,
-            Limit=limit,
+        self, pk: str, limit: int = 10
+    ) -> List[HistoryMessage]:
+        query_kwargs: Dict[str, Any] = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "PK = :pk",
+            "ExpressionAttributeValues": {":pk": {"S": pk}},
+            "ScanIndexForward": False,
+            "Limit": limit,
+            # Only role and content are sent to the model
+            "ProjectionExpression": "#r, #c",
+            "ExpressionAttributeNames": {"#r": "role", "#c": "content"},
+        }
+        deserialize: Callable[[Dict[str, Any]], Any] = (
+            self.deserializer.deserialize
         )
-        messages: List[Message] = [
-            Message.model_validate(item) for item in response.get("Items", [])
-        ]
+        messages: List[HistoryMessage] = []
+        while True:
+            response: Dict[str, Any] = self.client.query(**query_kwargs)
+            messages.extend(
+                {
+                    "role": deserialize(item["role"]),
+                    "content": deserialize(item["content"]),
+                }
+                for item in response.get("Items", [])
+            )
+
+            # A page is capped at 1 MB, so large messages can cut it short
+            last_key: Union[Dict[str, Any], None] = response.get(
+                "LastEvaluatedKey"
+            )
+            if last_key is None or len(messages) >= limit:
+                break
+            query_kwargs["ExclusiveStartKey"] = last_key
+            query_kwargs["Limit"] = limit - len(messages)
+
         messages.reverse()
         return messages
 
-    def save_assistant_message(
+    def build_assistant_item(
         self,
-        user_id: str,
-        session_id: str,
+        pk: str,
         content: Union[str, List[Union[str, Dict[Any, Any]]]],
         metadata: AssistantMetadata,
-    ) -> str:
-        message_id: str = str(uuid.uuid4())
-        timestamp: str = (
-            datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-        )
+    ) -> Dict[str, Any]:
+        message_id: str = os.urandom(16).hex()
+        timestamp: str = _utc_timestamp(time.time_ns())
 
-        pk: str = f"USER#{user_id}#SESSION#{session_id}"
         sk: str = timestamp
 
         item: Dict[str, Any] = {
             "PK": pk,
             "SK": sk,
             "message_id": message_id,
-            "role": "assistant",
+            "role": ASSISTANT_ROLE,
             "content": content,
             "created_at": timestamp,
-            "session_status": "active",
+            "session_status": SESSION_STATUS_ACTIVE,
             "model": BEDROCK_MODEL_ID,
-            "metadata": metadata.model_dump(),
+            "metadata": metadata,
         }
 
-        self.table.put_item(Item=item)
-        logger.info(f"Saved assistant message: {message_id}")
+        return item
 
-        return message_id
+    def save_messages(self, items: List[Mapping[str, Any]]) -> None:
+        with self.table.batch_writer(overwrite_by_pkeys=["PK", "SK"]) as batch:
+            for item in items:
+                batch.put_item(Item=item)
+        logger.info("Saved %d messages", len(items))
 
 
 class LLMProviderStrategy(ABC):
@@ -134,26 +228,33 @@ class LLMProviderStrategy(ABC):
 
 
 class LangchainLLMAmazonNovaLiteStrategy(LLMProviderStrategy):
+    def __init__(self, model_id: str, client: BaseClient):
+        super().__init__(model_id, client)
+
+        # Imported here so deployments selecting another strategy never pay
+        # for loading LangChain
+        from langchain_aws import ChatBedrockConverse
+
+        self.chat: ChatBedrockConverse = ChatBedrockConverse(
+            model=self.model_id,
+            client=self.client,
+            region_name=self.region_name,
+        )
+
     def invoke_llm(self, messages: List[LLMInputMessage]) -> LLMResponse:
-        logger.info(f"LangChain Strategy: Invoking model {self.model_id}")
+        from langchain_core.messages import AIMessage, HumanMessage
 
-        try:
-            chat = ChatBedrockConverse(
-                model=self.model_id,
-                client=self.client,
-                region_name=self.region_name,
-            )
+        logger.info("LangChain Strategy: Invoking model %s", self.model_id)
 
+        try:
             langchain_messages: List[Union[HumanMessage, AIMessage]] = []
-            for msg in messages:
-                role: str = msg.role
-                content: str = msg.content
+            for role, content in messages:
                 if role == "user":
                     langchain_messages.append(HumanMessage(content=content))
                 elif role == "assistant":
                     langchain_messages.append(AIMessage(content=content))
 
-            response: AIMessage = chat.invoke(langchain_messages)
+            response: AIMessage = self.chat.invoke(langchain_messages)
 
             assistant_message: Union[str, List[Union[str, Dict[Any, Any]]]] = (
                 response.content
@@ -174,20 +275,65 @@ class LangchainLLMAmazonNovaLiteStrategy(LLMProviderStrategy):
             raise
 
 
-class LLMProviderFactory:
-    def __init__(self, model_id: str, client: BaseClient):
-        self.model_id: str = model_id
-        self.client: BaseClient = client
-        self.strategies: Dict[str, type[LLMProviderStrategy]] = {
-            "LangchainLLMAmazonNovaLiteStrategy": LangchainLLMAmazonNovaLiteStrategy,
-        }
+class BedrockConverseStrategy(LLMProviderStrategy):
+    inference_config: Dict[str, int] = {"maxTokens": 2048}
 
-    def get_strategy(self, strategy_name: str) -> LLMProviderStrategy:
-        strategy_class = self.strategies.get(strategy_name)
-        if not strategy_class:
-            raise ValueError(f"Unknown LLM strategy: {strategy_name}")
+    @staticmethod
+    def build_converse_messages(
+        messages: List[LLMInputMessage],
+    ) -> List[Dict[str, Any]]:
+        # Converse requires the conversation to start with a user turn and
+        # roles to alternate, so leading assistant turns are dropped and
+        # consecutive turns from the same role are merged
+        converse_messages: List[Dict[str, Any]] = []
+        for role, content in messages:
+            if not converse_messages and role != "user":
+                continue
+            if converse_messages and converse_messages[-1]["role"] == role:
+                converse_messages[-1]["content"].append({"text": content})
+            else:
+                converse_messages.append(
+                    {"role": role, "content": [{"text": content}]}
+                )
+        return converse_messages
 
-        return strategy_class(self.model_id, self.client)
+    def invoke_llm(self, messages: List[LLMInputMessage]) -> LLMResponse:
+        logger.info("Converse Strategy: Invoking model %s", self.model_id)
+
+        try:
+            response: Dict[str, Any] = self.client.converse(
+                modelId=self.model_id,
+                messages=self.build_converse_messages(messages),
+                inferenceConfig=self.inference_config,
+            )
+
+            output_message: Dict[str, Any] = response["output"]["message"]
+            content_blocks: List[Dict[str, Any]] = output_message["content"]
+            usage_metadata: Dict[str, int] = response.get("usage", {})
+
+            usage: LLMUsage = LLMUsage(
+                input_tokens=usage_metadata.get("inputTokens", 0),
+                output_tokens=usage_metadata.get("outputTokens", 0),
+            )
+
+            return LLMResponse(
+                content="".join(
+                    block["text"]
+                    for block in content_blocks
+                    if "text" in block
+                ),
+                usage=usage,
+            )
+
+        except Exception as e:
+            logger.exception("Error invoking Bedrock via Converse")
+            raise
+
+
+_STRATEGIES: Dict[str, type[LLMProviderStrategy]] = {
+    "LangchainLLMAmazonNovaLiteStrategy": LangchainLLMAmazonNovaLiteStrategy,
+    "BedrockConverseStrategy": BedrockConverseStrategy,
+}
 
 
 class LLMProvider:
@@ -196,16 +342,20 @@ class LLMProvider:
 
     @staticmethod
     def build_bedrock_messages(
-        conversation_history: List[Message],
+        conversation_history: List[HistoryMessage],
     ) -> List[LLMInputMessage]:
-        messages: List[LLMInputMessage] = []
-        for msg in conversation_history:
-            content: Union[str, Dict[str, Union[str, int]]] = msg.content
-            if not isinstance(content, str):
-                content = json.dumps(content)
-
-            messages.append(LLMInputMessage(role=msg.role, content=content))
-        return messages
+        dumps = _DUMPS
+        return [
+            (
+                msg["role"],
+                (
+                    msg["content"]
+                    if isinstance(msg["content"], str)
+                    else dumps(msg["content"], default=str).decode()
+                ),
+            )
+            for msg in conversation_history
+        ]
 
     def invoke_llm(self, messages: List[LLMInputMessage]) -> LLMResponse:
         return self.strategy.invoke_llm(messages)
@@ -220,83 +370,180 @@ class Worker:
         self.dynamodb_repository: DynamoDBRepository = dynamodb_repository
         self.llm_provider: LLMProvider = llm_provider
 
-    def process_record(self, message_body: WorkerMessageBody) -> None:
-        user_id: str = message_body.user_id
-        session_id: str = message_body.session_id
+    def process_record(
+        self, message_body: WorkerMessageBody
+    ) -> List[Mapping[str, Any]]:
+        pk: str = _session_pk(message_body.user_id, message_body.session_id)
         user_message_id: str = message_body.message_id
+        user_message: Union[Message, None] = message_body.message
 
-        logger.info(f"Processing message: {user_message_id}")
+        logger.info("Processing message: %s", user_message_id)
 
-        conversation_history: List[Message] = (
+        conversation_history: List[HistoryMessage] = (
             self.dynamodb_repository.get_conversation_history(
-                user_id, session_id, limit=20
+                pk, limit=20 if user_message is None else 19
             )
         )
         logger.info(
-            f"Fetched {len(conversation_history)} messages from history"
+            "Fetched %d messages from history", len(conversation_history)
         )
 
+        if user_message is not None:
+            conversation_history.append(user_message)
+
         llm_messages: List[LLMInputMessage] = (
             self.llm_provider.build_bedrock_messages(conversation_history)
         )
 
-        start_time: datetime = datetime.now(timezone.utc)
+        start_ns: int = time.perf_counter_ns()
         llm_response: LLMResponse = self.llm_provider.invoke_llm(llm_messages)
-        end_time: datetime = datetime.now(timezone.utc)
-
-        latency_ms: int = int((end_time - start_time).total_seconds() * 1000)
+        latency_ms: int = (time.perf_counter_ns() - start_ns) // 1_000_000
 
         usage_metrics: LLMUsage = llm_response.usage
 
-        metadata: AssistantMetadata = AssistantMetadata(
-            latency_ms=latency_ms,
-            input_tokens=usage_metrics.input_tokens,
-            output_tokens=usage_metrics.output_tokens,
-            user_message_id=user_message_id,
-        )
+        metadata: AssistantMetadata = {
+            "latency_ms": latency_ms,
+            "input_tokens": usage_metrics.input_tokens,
+            "output_tokens": usage_metrics.output_tokens,
+            "user_message_id": user_message_id,
+        }
 
-        assistant_message_id: str = (
-            self.dynamodb_repository.save_assistant_message(
-                user_id=user_id,
-                session_id=session_id,
+        assistant_item: Dict[str, Any] = (
+            self.dynamodb_repository.build_assistant_item(
+                pk=pk,
                 content=llm_response.content,
                 metadata=metadata,
             )
         )
 
+        items: List[Mapping[str, Any]] = [assistant_item]
+        if user_message is not None:
+            items.insert(0, user_message)
+
         logger.info(
-            f"Successfully processed message {user_message_id}, created assistant message {assistant_message_id}"
+            "Successfully processed message %s, created assistant message %s",
+            user_message_id,
+            assistant_item["message_id"],
         )
 
+        return items
+
 
 dynamodb_repository: DynamoDBRepository = DynamoDBRepository(
     DYNAMODB_TABLE, dynamodb_resource
 )
 
-strategy: LLMProviderStrategy = LLMProviderFactory(
+# LLM_PROVIDER_STRATEGY is fixed per deployment, so the strategy is resolved
+# once at import time
+if LLM_PROVIDER_STRATEGY not in _STRATEGIES:
+    raise ValueError(f"Unknown LLM strategy: {LLM_PROVIDER_STRATEGY}")
+
+strategy: LLMProviderStrategy = _STRATEGIES[LLM_PROVIDER_STRATEGY](
     BEDROCK_MODEL_ID, bedrock_client
-).get_strategy(LLM_PROVIDER_STRATEGY)
+)
 
 llm_provider: LLMProvider = LLMProvider(strategy)
 
 worker: Worker = Worker(dynamodb_repository, llm_provider)
 
+record_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_RECORDS
+)
+
+# user message id -> assistant message id for replies this container has
+# already saved, so SQS redeliveries to a warm container skip Bedrock.
+# Only written after the batch write, once every record thread is done.
+_seen: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _remember_replies(items: List[Mapping[str, Any]]) -> None:
+    for item in items:
+        if item["role"] != ASSISTANT_ROLE:
+            continue
+        _seen[item["metadata"]["user_message_id"]] = item["message_id"]
+        if len(_seen) > MAX_SEEN_MESSAGES:
+            _seen.popitem(last=False)
+
+
+def process_sqs_record(payload: Dict[str, Any]) -> List[Mapping[str, Any]]:
+    if not payload.get("user_id") or not payload.get("session_id"):
+        raise ValueError("Message body is missing user_id or session_id")
+
+    # The API is the validating boundary; re-validating here only burns CPU
+    message_body: WorkerMessageBody = WorkerMessageBody.model_construct(
+        **payload
+    )
+
+    assistant_message_id: Union[str, None] = _seen.get(message_body.message_id)
+    if assistant_message_id is not None:
+        logger.info(
+            "Skipping redelivered message %s, already answered by %s",
+            message_body.message_id,
+            assistant_message_id,
+        )
+        return []
+
+    return worker.process_record(message_body)
+
 
 @logger.inject_lambda_context
 def lambda_handler(
     event: Dict[str, Any], context: LambdaContext
 ) -> Dict[str, Any]:
-    logger.info("Worker Lambda triggered", extra={"event": event})
+    # The full event is only serialized when debug logging is enabled
+    logger.info("Worker Lambda triggered")
+    logger.debug("Worker Lambda event", extra={"event": event})
+
+    batch_item_failures: List[Dict[str, str]] = []
+    futures: Dict[str, Future[List[Mapping[str, Any]]]] = {}
+    submitted_message_ids: Set[str] = set()
+    for record in event.get("Records", []):
+        sqs_message_id: str = record["messageId"]
+        try:
+            payload: Dict[str, Any] = orjson.loads(record["body"])
+            if not isinstance(payload, dict):
+                raise ValueError("Message body is not a JSON object")
+        except ValueError:
+            logger.exception("Error decoding SQS message %s", sqs_message_id)
+            batch_item_failures.append({"itemIdentifier": sqs_message_id})
+            continue
+
+        # SQS can deliver copies of one message in the same batch; only
+        # the first is answered, the rest are acknowledged with it
+        message_id: Any = payload.get("message_id")
+        if isinstance(message_id, str):
+            if message_id in submitted_message_ids:
+                logger.info(
+                    "Skipping duplicate delivery of message %s", message_id
+                )
+                continue
+            submitted_message_ids.add(message_id)
+
+        futures[sqs_message_id] = record_executor.submit(
+            process_sqs_record, payload
+        )
 
-    try:
-        for record in event.get("Records", []):
-            message_body: WorkerMessageBody = WorkerMessageBody.parse_raw(
-                record["body"]
+    processed_ids: List[str] = []
+    items: List[Mapping[str, Any]] = []
+    for sqs_message_id, future in futures.items():
+        try:
+            items.extend(future.result())
+            processed_ids.append(sqs_message_id)
+        except Exception:
+            logger.exception("Error processing SQS message %s", sqs_message_id)
+            batch_item_failures.append({"itemIdentifier": sqs_message_id})
+
+    # One batch write for the whole SQS batch instead of one per record
+    if items:
+        try:
+            dynamodb_repository.save_messages(items)
+        except Exception:
+            logger.exception("Error saving messages for SQS batch")
+            batch_item_failures.extend(
+                {"itemIdentifier": sqs_message_id}
+                for sqs_message_id in processed_ids
             )
-            worker.process_record(message_body)
-
-        return {"statusCode": 200, "body": json.dumps({"status": "success"})}
+        else:
+            _remember_replies(items)
 
-    except Exception as e:
-        logger.exception("Error processing SQS message batch")
-        raise
+    return {"batchItemFailures": batch_item_failures}